@@ -21,16 +21,19 @@
 # SOFTWARE.
 #
 ####################
-import sys, os, re, codecs, json, argparse, getpass, base64
+import sys, os, re, io, json, argparse, getpass, base64, threading
 # import class and constants
 from datetime import datetime, timedelta
 from urllib.parse import quote_plus
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import ldap3
-from ldap3 import Server, Connection, SIMPLE, SYNC, ALL, SASL, NTLM
-from ldap3.core.exceptions import LDAPKeyError, LDAPAttributeError, LDAPCursorError, LDAPInvalidDnError
-from ldap3.abstract import attribute, attrDef
+from ldap3 import Server, Connection, SIMPLE, SYNC, ALL, SASL, NTLM, BASE, SUBTREE
+from ldap3.core.exceptions import LDAPKeyError, LDAPAttributeError, LDAPCursorError, LDAPInvalidDnError, LDAPBindError, LDAPOperationResult
 from ldap3.utils import dn
 from ldap3.protocol.formatters.formatters import format_sid
+from ldap3.utils.conv import format_json
 
 # dnspython, for resolving hostnames
 import dns.resolver
@@ -114,10 +117,28 @@ attr_translations = {'sAMAccountName':'SAM Name',
                      'ms-DS-MachineAccountQuota':'Machine Account Quota',
                      'flatName':'NETBIOS Domain name'}
 
+#Escaped special DN characters, and characters that are not valid in a HTML id
+_CN_UNESCAPE = re.compile(r'\\([ "#+,;<=>\\\x00])')
+_ID_RE = re.compile(r'[^a-zA-Z0-9_\-]+')
+
+#Attributes (lowercase) that have their own formatting in the reports, all others are formatted as plain values
+_FORMATTED_ATTRIBUTES = frozenset(['useraccountcontrol', 'member', 'memberof', 'primarygroupid', 'description', 'pwdproperties',
+                                   'trustattributes', 'trustdirection', 'trusttype', 'securityidentifier', 'minpwdage', 'maxpwdage',
+                                   'lockoutobservationwindow', 'lockoutduration', 'objectsid', 'cn'])
+
 MINIMAL_COMPUTERATTRIBUTES = ['cn', 'sAMAccountName', 'dNSHostName', 'operatingSystem', 'operatingSystemServicePack', 'operatingSystemVersion', 'lastLogon', 'userAccountControl', 'whenCreated', 'objectSid', 'description', 'msDS-AllowedToDelegateTo', 'objectClass']
 MINIMAL_USERATTRIBUTES = ['cn', 'name', 'sAMAccountName', 'memberOf', 'primaryGroupId', 'whenCreated', 'whenChanged', 'lastLogon', 'userAccountControl', 'pwdLastSet', 'objectSid', 'description', 'servicePrincipalName', 'msDS-AllowedToDelegateTo', 'objectClass']
 MINIMAL_GROUPATTRIBUTES = ['cn', 'name', 'sAMAccountName', 'memberOf', 'description', 'whenCreated', 'whenChanged', 'objectSid', 'distinguishedName', 'objectClass']
 
+#Get an attribute of an entry, or None if the entry does not have this attribute or it has no values
+#Attributes which are requested explicitly but are not set are returned by ldap3 without values, these are treated as missing
+#Looking it up directly is a lot cheaper than letting ldap3 raise an exception for a missing attribute
+def get_entry_attribute(entry, name):
+    attr = entry._state.attributes.get(name)
+    if attr is None or not attr.values:
+        return None
+    return attr
+
 #Class containing the default config
 class domainDumpConfig():
     def __init__(self):
@@ -149,7 +170,10 @@ class domainDumpConfig():
         #Other settings
         self.lookuphostnames = False #Look up hostnames of computers to get their IP address
         self.dnsserver = '' #Addres of the DNS server to use, if not specified default DNS will be used
+        self.dnsworkers = 64 #Number of hostnames to resolve in parallel
         self.minimal = False #Only query minimal list of attributes
+        self.poolsize = 1 #Number of LDAP connections used for parallel queries, 1 means all queries use the main connection (main() uses --pool-size)
+        self.pagesize = 1000 #Page size for paged searches, if the server maximum can't be determined
 
 #Domaindumper main class
 class domainDumper():
@@ -169,23 +193,157 @@ class domainDumper():
         self.groups_dnmap = None #CN map for group IDs to CN
         self.groups_dict = None #Dictionary of groups by CN
         self.trusts = None #Domain trusts
+        self.pagesize = None #Page size for paged searches, determined on first use
+        self.dn_cn_cache = {} #Cache of group CNs by DN
+        self.dnslocal = threading.local() #Per thread DNS resolvers
+        self.ipv4 = {} #Resolved IPv4 addresses of computers by DN
+        self.connlocal = threading.local() #Per thread LDAP connections of parallel queries
 
     #Get the server root from the default naming context
     def getRoot(self):
         return self.server.info.other['defaultNamingContext'][0]
 
+    #Get the connection of the current thread, which is the main connection unless this is a parallel query
+    def getConnection(self):
+        connection = getattr(self.connlocal, 'connection', None)
+        if connection is None:
+            return self.connection
+        return connection
+
+    #Open and bind a new connection to the server, with the same credentials as the main connection
+    def openWorkerConnection(self):
+        c = self.connection
+        connection = Connection(self.server, user=c.user, password=c.password, authentication=c.authentication,
+                                sasl_mechanism=c.sasl_mechanism, sasl_credentials=c.sasl_credentials, auto_range=c.auto_range,
+                                receive_timeout=c.receive_timeout)
+        if c.tls_started:
+            connection.start_tls()
+        if not connection.bind():
+            raise LDAPBindError('Could not bind an additional connection: %s' % connection.result)
+        return connection
+
+    #Run a function on the connection of the current worker thread, which is opened on first use
+    def runOnWorkerConnection(self, connections, func, args):
+        if getattr(self.connlocal, 'connection', None) is None:
+            self.connlocal.connection = self.openWorkerConnection()
+            connections.append(self.connlocal.connection)
+        return func(*args)
+
+    #Run functions in parallel and return their results, every worker thread uses its own connection
+    #A paged search keeps its paging state on the connection, so it can't be spread over multiple connections
+    def runParallel(self, calls, workers):
+        connections = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.runOnWorkerConnection, connections, func, args) for func, args in calls]
+            return [future.result() for future in futures]
+        finally:
+            for connection in connections:
+                connection.unbind()
+
+    #Convert a list of search responses to entries
+    #The entries of the connection can't be used after a search, since the range retrieval searches replace the connection response
+    def entriesFromResponse(self, response, request):
+        return self.getConnection()._get_entries(response, request)
+
+    #Perform a search and return the entries
+    def searchEntries(self, search_base, search_filter, attributes):
+        connection = self.getConnection()
+        connection.search(search_base, search_filter, attributes=attributes)
+        response = connection.response
+        request = connection.request
+        self.completeRangedAttributes(response)
+        return self.entriesFromResponse(response, request)
+
+    #Get the maximum page size the server allows (MaxPageSize in the default query policy)
+    #Larger pages mean fewer round trips, if the policy can't be read the configured page size is used
+    #With raise_exceptions set on the connection, a failed search (no such object, insufficient rights) raises LDAPOperationResult
+    def getPageSize(self):
+        if self.pagesize is not None:
+            return self.pagesize
+        pagesize = self.config.pagesize
+        try:
+            policydn = 'CN=Default Query Policy,CN=Query-Policies,CN=Directory Service,CN=Windows NT,CN=Services,%s' % self.server.info.other['configurationNamingContext'][0]
+            entries = self.searchEntries(policydn, '(objectClass=*)', attributes=['lDAPAdminLimits'])
+            for limit in entries[0]['lDAPAdminLimits'].values:
+                name, _, value = limit.partition('=')
+                if name.lower() == 'maxpagesize':
+                    pagesize = int(value)
+        except (KeyError, IndexError, ValueError, AttributeError, LDAPKeyError, LDAPCursorError, LDAPOperationResult):
+            pass
+        self.pagesize = pagesize
+        return pagesize
+
+    #Perform a search and return the raw responses, without completing ranged attributes
+    def searchResponse(self, search_base, search_filter, attributes, search_scope=SUBTREE):
+        connection = self.getConnection()
+        connection.search(search_base, search_filter, search_scope=search_scope, attributes=attributes)
+        return connection.response
+
+    #Perform a paged search and return the entries
+    def pagedSearchEntries(self, search_base, search_filter, attributes):
+        connection = self.getConnection()
+        response = connection.extend.standard.paged_search(search_base, search_filter, attributes=attributes, paged_size=self.getPageSize(), generator=False)
+        request = connection.request
+        self.completeRangedAttributes(response)
+        return self.entriesFromResponse(response, request)
+
+    #Get the values of an attribute from the given start of the range until the end
+    #The server returns at most MaxValRange values per search, as attribute;range=start-end
+    def getRangedAttributeValues(self, dn, attribute, start):
+        raw_values = []
+        values = []
+        while True:
+            response = self.searchResponse(dn, '(objectClass=*)', ['%s;range=%d-*' % (attribute, start)], search_scope=BASE)
+            entries = [resp for resp in response if resp['type'] == 'searchResEntry']
+            ranged = [name for name in entries[0]['raw_attributes'] if ';range=' in name] if entries else []
+            if not ranged:
+                break
+            raw_values.extend(entries[0]['raw_attributes'][ranged[0]])
+            values.extend(entries[0]['attributes'][ranged[0]])
+            end = ranged[0].partition(';range=')[2].partition('-')[2]
+            if end == '*':
+                break
+            start = int(end) + 1
+        return raw_values, values
+
+    #Complete the attributes of which the server returned only the first range of values (such as the members of large groups)
+    #The remaining ranges of the different entries are retrieved in parallel if multiple connections may be used
+    #A parallel query already holds one of these connections, so it retrieves them itself to stay within the pool size
+    def completeRangedAttributes(self, response):
+        incomplete = []
+        for resp in response:
+            if resp['type'] != 'searchResEntry':
+                continue
+            for name in [name for name in resp['raw_attributes'] if ';range=' in name]:
+                attribute, _, valuerange = name.partition(';range=')
+                end = valuerange.partition('-')[2]
+                resp['raw_attributes'][attribute] = list(resp['raw_attributes'].get(attribute) or []) + list(resp['raw_attributes'].pop(name))
+                resp['attributes'][attribute] = list(resp['attributes'].get(attribute) or []) + list(resp['attributes'].pop(name))
+                if end != '*':
+                    incomplete.append((resp, attribute, int(end) + 1))
+        if not incomplete:
+            return
+        if self.config.poolsize > 1 and getattr(self.connlocal, 'connection', None) is None:
+            results = self.runParallel([(self.getRangedAttributeValues, (resp['dn'], attribute, start)) for resp, attribute, start in incomplete], self.config.poolsize)
+        else:
+            results = [self.getRangedAttributeValues(resp['dn'], attribute, start) for resp, attribute, start in incomplete]
+        for (resp, attribute, _), (raw_values, values) in zip(incomplete, results):
+            resp['raw_attributes'][attribute].extend(raw_values)
+            resp['attributes'][attribute].extend(values)
+
     #Query the groups of the current user
     def getCurrentUserGroups(self, username, domainsid=None):
-        self.connection.search(self.root, '(&(objectCategory=person)(objectClass=user)(sAMAccountName=%s))' % username, attributes=['cn', 'memberOf', 'primaryGroupId'])
+        entries = self.searchEntries(self.root, '(&(objectCategory=person)(objectClass=user)(sAMAccountName=%s))' % username, attributes=['cn', 'memberOf', 'primaryGroupId'])
         try:
-            groups = self.connection.entries[0]['memberOf'].values
+            groups = entries[0]['memberOf'].values
             if domainsid is not None:
-                groups.append(self.getGroupDNfromID(domainsid, self.connection.entries[0]['primaryGroupId'].value))
+                groups.append(self.getGroupDNfromID(domainsid, entries[0]['primaryGroupId'].value))
             return groups
         except LDAPKeyError:
             #No groups, probably just member of the primary group
             if domainsid is not None:
-                primarygroup = self.getGroupDNfromID(domainsid, self.connection.entries[0]['primaryGroupId'].value)
+                primarygroup = self.getGroupDNfromID(domainsid, entries[0]['primaryGroupId'].value)
                 return [primarygroup]
             else:
                 return []
@@ -193,13 +351,54 @@ class domainDumper():
             #The username does not exist (might be a computer account)
             return []
 
+    #Query the domain object and the current user in a single search
+    #Returns the domain SID and the user entry, either of which may be None if it was not found
+    def getBootstrapEntries(self, username):
+        entries = self.searchEntries(self.root, '(|(&(objectCategory=person)(objectClass=user)(sAMAccountName=%s))(objectClass=domain))' % username, attributes=['objectClass', 'objectSid', 'memberOf', 'primaryGroupId'])
+        domainsid = None
+        user = None
+        for entry in entries:
+            objectclass = get_entry_attribute(entry, 'objectClass')
+            if objectclass is not None and 'domain' in [oc.lower() for oc in objectclass.values]:
+                if domainsid is None:
+                    domainsid = get_entry_attribute(entry, 'objectSid')
+            elif user is None:
+                user = entry
+        if domainsid is not None:
+            domainsid = domainsid.value
+        return domainsid, user
+
+    #Resolve a number of group IDs to DNs in a single search
+    #Returns a dict of group ID to DN, group IDs that do not exist are left out
+    def getGroupDNsfromIDs(self, domainsid, gids):
+        sids = {'%s-%d' % (domainsid, gid): gid for gid in gids}
+        entries = self.searchEntries(self.root, '(|%s)' % ''.join(['(objectSid=%s)' % sid for sid in sids]), attributes=['objectSid', 'distinguishedName'])
+        groupdns = {}
+        for entry in entries:
+            sid = get_entry_attribute(entry, 'objectSid')
+            if sid is not None and sid.value in sids:
+                groupdns[sids[sid.value]] = entry.entry_dn
+        return groupdns
+
     #Check if the user is part of the Domain Admins or Enterprise Admins group, or any of their subgroups
     def isDomainAdmin(self, username):
-        domainsid = self.getRootSid()
-        groups = self.getCurrentUserGroups(username, domainsid)
-        #Get DA and EA group DNs
-        dagroupdn = self.getDAGroupDN(domainsid)
-        eagroupdn = self.getEAGroupDN(domainsid)
+        domainsid, user = self.getBootstrapEntries(username)
+        if domainsid is None or user is None:
+            #The username does not exist (might be a computer account)
+            return False
+        memberof = get_entry_attribute(user, 'memberOf')
+        groups = list(memberof.values) if memberof is not None else []
+        primarygroup = get_entry_attribute(user, 'primaryGroupId')
+        #Get the primary group, DA and EA group DNs
+        gids = [512, 519]
+        if primarygroup is not None:
+            gids.append(primarygroup.value)
+        groupdns = self.getGroupDNsfromIDs(domainsid, gids)
+        if primarygroup is not None and primarygroup.value in groupdns:
+            groups.append(groupdns[primarygroup.value])
+        dagroupdn = groupdns.get(512)
+        #EA group does not exist if this is not the root domain, it could be in a parent domain
+        eagroupdn = groupdns.get(519, False)
         #First, simple checks
         for group in groups:
             if 'CN=Administrators' in group or 'CN=Domain Admins' in group or dagroupdn == group:
@@ -208,82 +407,79 @@ class domainDumper():
             if 'CN=Enterprise Admins' in group or (eagroupdn is not False and eagroupdn == group):
                 return True
         #Now, just do a recursive check in both groups and their subgroups using LDAP_MATCHING_RULE_IN_CHAIN
-        self.connection.search(self.root, '(&(objectCategory=person)(objectClass=user)(sAMAccountName=%s)(memberOf:1.2.840.113556.1.4.1941:=%s))' % (username, dagroupdn), attributes=['cn', 'sAMAccountName'])
-        if len(self.connection.entries) > 0:
-            return True
-        self.connection.search(self.root, '(&(objectCategory=person)(objectClass=user)(sAMAccountName=%s)(memberOf:1.2.840.113556.1.4.1941:=%s))' % (username, eagroupdn), attributes=['cn', 'sAMAccountName'])
-        if len(self.connection.entries) > 0:
-            return True
+        chainfilters = ['(memberOf:1.2.840.113556.1.4.1941:=%s)' % groupdn for groupdn in (dagroupdn, eagroupdn) if groupdn]
+        if chainfilters:
+            entries = self.searchEntries(self.root, '(&(objectCategory=person)(objectClass=user)(sAMAccountName=%s)(|%s))' % (username, ''.join(chainfilters)), attributes=['cn', 'sAMAccountName'])
+            if len(entries) > 0:
+                return True
         #At last, check the users primary group ID
         return False
 
+    #Whether to query only the minimal list of attributes
+    #All other attributes only end up in the JSON files, so they are not needed if no JSON is written
+    #Attributes of the minimal lists which are not set are returned without values, these are handled as missing attributes
+    def useMinimalAttributes(self):
+        return self.config.minimal or not self.config.outputjson
+
     #Get all users
     def getAllUsers(self):
-        if self.config.minimal:
-            self.connection.extend.standard.paged_search('%s' % (self.root), '(&(objectCategory=person)(objectClass=user))', attributes=MINIMAL_USERATTRIBUTES, paged_size=500, generator=False)
+        if self.useMinimalAttributes():
+            return self.pagedSearchEntries('%s' % (self.root), '(&(objectCategory=person)(objectClass=user))', attributes=MINIMAL_USERATTRIBUTES)
         else:
-            self.connection.extend.standard.paged_search('%s' % (self.root), '(&(objectCategory=person)(objectClass=user))', attributes=ldap3.ALL_ATTRIBUTES, paged_size=500, generator=False)
-        return self.connection.entries
+            return self.pagedSearchEntries('%s' % (self.root), '(&(objectCategory=person)(objectClass=user))', attributes=ldap3.ALL_ATTRIBUTES)
 
     #Get all computers in the domain
     def getAllComputers(self):
-        if self.config.minimal:
-            self.connection.extend.standard.paged_search('%s' % (self.root), '(&(objectClass=computer)(objectClass=user))', attributes=MINIMAL_COMPUTERATTRIBUTES, paged_size=500, generator=False)
+        if self.useMinimalAttributes():
+            return self.pagedSearchEntries('%s' % (self.root), '(&(objectClass=computer)(objectClass=user))', attributes=MINIMAL_COMPUTERATTRIBUTES)
         else:
-            self.connection.extend.standard.paged_search('%s' % (self.root), '(&(objectClass=computer)(objectClass=user))', attributes=ldap3.ALL_ATTRIBUTES, paged_size=500, generator=False)
-        return self.connection.entries
+            return self.pagedSearchEntries('%s' % (self.root), '(&(objectClass=computer)(objectClass=user))', attributes=ldap3.ALL_ATTRIBUTES)
 
     #Get all user SPNs
     def getAllUserSpns(self):
-        if self.config.minimal:
-            self.connection.extend.standard.paged_search('%s' % (self.root), '(&(objectCategory=person)(objectClass=user)(servicePrincipalName=*))', attributes=MINIMAL_USERATTRIBUTES, paged_size=500, generator=False)
+        if self.useMinimalAttributes():
+            return self.pagedSearchEntries('%s' % (self.root), '(&(objectCategory=person)(objectClass=user)(servicePrincipalName=*))', attributes=MINIMAL_USERATTRIBUTES)
         else:
-            self.connection.extend.standard.paged_search('%s' % (self.root), '(&(objectCategory=person)(objectClass=user)(servicePrincipalName=*))', attributes=ldap3.ALL_ATTRIBUTES, paged_size=500, generator=False)
-        return self.connection.entries
+            return self.pagedSearchEntries('%s' % (self.root), '(&(objectCategory=person)(objectClass=user)(servicePrincipalName=*))', attributes=ldap3.ALL_ATTRIBUTES)
 
     #Get all defined groups
     def getAllGroups(self):
-        if self.config.minimal:
-            self.connection.extend.standard.paged_search(self.root, '(objectClass=group)', attributes=MINIMAL_GROUPATTRIBUTES, paged_size=500, generator=False)
+        if self.useMinimalAttributes():
+            return self.pagedSearchEntries(self.root, '(objectClass=group)', attributes=MINIMAL_GROUPATTRIBUTES)
         else:
-            self.connection.extend.standard.paged_search(self.root, '(objectClass=group)', attributes=ldap3.ALL_ATTRIBUTES, paged_size=500, generator=False)
-        return self.connection.entries
+            return self.pagedSearchEntries(self.root, '(objectClass=group)', attributes=ldap3.ALL_ATTRIBUTES)
 
     #Get the domain policies (such as lockout policy)
     def getDomainPolicy(self):
-        self.connection.search(self.root, '(objectClass=domain)', attributes=ldap3.ALL_ATTRIBUTES)
-        return self.connection.entries
+        return self.searchEntries(self.root, '(objectClass=domain)', attributes=ldap3.ALL_ATTRIBUTES)
 
     #Get domain trusts
     def getTrusts(self):
-        self.connection.search(self.root, '(objectClass=trustedDomain)', attributes=ldap3.ALL_ATTRIBUTES)
-        return self.connection.entries
+        return self.searchEntries(self.root, '(objectClass=trustedDomain)', attributes=ldap3.ALL_ATTRIBUTES)
 
     #Get all defined security groups
     #Syntax from:
     #https://ldapwiki.willeke.com/wiki/Active%20Directory%20Group%20Related%20Searches
     def getAllSecurityGroups(self):
-        self.connection.search(self.root, '(groupType:1.2.840.113556.1.4.803:=2147483648)', attributes=ldap3.ALL_ATTRIBUTES)
-        return self.connection.entries
+        return self.searchEntries(self.root, '(groupType:1.2.840.113556.1.4.803:=2147483648)', attributes=ldap3.ALL_ATTRIBUTES)
 
     #Get the SID of the root object
     def getRootSid(self):
-        self.connection.search(self.root, '(objectClass=domain)', attributes=['objectSid'])
+        entries = self.searchEntries(self.root, '(objectClass=domain)', attributes=['objectSid'])
         try:
-            sid = self.connection.entries[0].objectSid
+            sid = entries[0].objectSid
         except (LDAPAttributeError, LDAPCursorError, IndexError):
             return False
         return sid
 
     #Get group members recursively using LDAP_MATCHING_RULE_IN_CHAIN (1.2.840.113556.1.4.1941)
     def getRecursiveGroupmembers(self, groupdn):
-        self.connection.extend.standard.paged_search(self.root, '(&(objectCategory=person)(objectClass=user)(memberOf:1.2.840.113556.1.4.1941:=%s))' % groupdn, attributes=MINIMAL_USERATTRIBUTES, paged_size=500, generator=False)
-        return self.connection.entries
+        return self.pagedSearchEntries(self.root, '(&(objectCategory=person)(objectClass=user)(memberOf:1.2.840.113556.1.4.1941:=%s))' % groupdn, attributes=MINIMAL_USERATTRIBUTES)
 
     #Resolve group ID to DN
     def getGroupDNfromID(self, domainsid, gid):
-        self.connection.search(self.root, '(objectSid=%s-%d)' % (domainsid, gid), attributes=['distinguishedName'])
-        return self.connection.entries[0]['distinguishedName'].value
+        entries = self.searchEntries(self.root, '(objectSid=%s-%d)' % (domainsid, gid), attributes=['distinguishedName'])
+        return entries[0]['distinguishedName'].value
 
     #Get Domain Admins group DN
     def getDAGroupDN(self, domainsid):
@@ -298,53 +494,69 @@ class domainDumper():
             return False
 
 
+    #Get the DNS resolver of the current thread, since resolvers are not guaranteed to be thread safe
+    def getDnsResolver(self):
+        try:
+            return self.dnslocal.resolver
+        except AttributeError:
+            dnsresolver = dns.resolver.Resolver()
+            dnsresolver.lifetime = 2
+            if self.config.dnsserver != '':
+                dnsresolver.nameservers = [self.config.dnsserver]
+            self.dnslocal.resolver = dnsresolver
+            return dnsresolver
+
+    #Resolve a hostname to its IPv4 address
+    def resolveHostname(self, hostname):
+        try:
+            answers = self.getDnsResolver().query(hostname, 'A')
+            return str(answers.response.answer[0][0])
+        except dns.resolver.NXDOMAIN:
+            return 'error.NXDOMAIN'
+        except dns.resolver.Timeout:
+            return 'error.TIMEOUT'
+
     #Lookup all computer DNS names to get their IP
+    #The lookups are network bound, so they are done in parallel
     def lookupComputerDnsNames(self):
-        dnsresolver = dns.resolver.Resolver()
-        dnsresolver.lifetime = 2
-        ipdef = attrDef.AttrDef('ipv4')
-        if self.config.dnsserver != '':
-            dnsresolver.nameservers = [self.config.dnsserver]
+        hostnames = []
         for computer in self.computers:
-            try:
-                answers = dnsresolver.query(computer.dNSHostName.values[0], 'A')
-                ip = str(answers.response.answer[0][0])
-            except dns.resolver.NXDOMAIN:
-                ip = 'error.NXDOMAIN'
-            except dns.resolver.Timeout:
-                ip = 'error.TIMEOUT'
-            except (LDAPAttributeError, LDAPCursorError):
-                ip = 'error.NOHOSTNAME'
-            #Construct a custom attribute as workaround
-            ipatt = attribute.Attribute(ipdef, computer, None)
-            ipatt.__dict__['_response'] = ip
-            ipatt.__dict__['raw_values'] = [ip]
-            ipatt.__dict__['values'] = [ip]
-            #Add the attribute to the entry's dictionary
-            computer._state.attributes['IPv4'] = ipatt
+            hostattr = get_entry_attribute(computer, 'dNSHostName')
+            #Computers without a hostname (or an empty one) can't be resolved
+            if hostattr is not None and hostattr.values[0]:
+                hostnames.append(hostattr.values[0])
+            else:
+                hostnames.append(None)
+        #Every hostname only has to be resolved once
+        with ThreadPoolExecutor(max_workers=self.config.dnsworkers) as executor:
+            lookups = {hostname: executor.submit(self.resolveHostname, hostname) for hostname in set(hostnames) if hostname is not None}
+        for computer, hostname in zip(self.computers, hostnames):
+            if hostname is None:
+                self.ipv4[computer.entry_dn] = 'error.NOHOSTNAME'
+            else:
+                self.ipv4[computer.entry_dn] = lookups[hostname].result()
 
     #Create a dictionary of all operating systems with the computer accounts that are associated
     def sortComputersByOS(self, items):
-        osdict = {}
+        osdict = defaultdict(list)
         for computer in items:
-            try:
-                cos = computer.operatingSystem.value or 'Unknown'
-            except (LDAPAttributeError, LDAPCursorError):
-                cos = 'Unknown'
-            try:
-                osdict[cos].append(computer)
-            except KeyError:
-                #New OS
-                osdict[cos] = [computer]
-        return osdict
+            osattr = get_entry_attribute(computer, 'operatingSystem')
+            if osattr is not None and osattr.value:
+                osdict[osattr.value].append(computer)
+            else:
+                osdict['Unknown'].append(computer)
+        return dict(osdict)
 
     #Map all groups on their ID (taken from their SID) to CNs
     #This is used for getting the primary group of a user
+    #The CNs of the groups are added to the DN cache as well, so their DNs never have to be parsed
     def mapGroupsIdsToDns(self):
         dnmap = {}
         for group in self.groups:
             gid = int(group.objectSid.value.split('-')[-1])
-            dnmap[gid] = group.distinguishedName.values[0]
+            groupdn = group.distinguishedName.values[0]
+            dnmap[gid] = groupdn
+            self.dn_cn_cache[groupdn] = group.cn.values[0]
         self.groups_dnmap = dnmap
         return dnmap
 
@@ -355,61 +567,74 @@ class domainDumper():
         return gdict
 
     #Get CN from DN
+    #The same group DNs are parsed for many users, so the result is cached
     def getGroupCnFromDn(self, dnin):
-        cn = self.unescapecn(dn.parse_dn(dnin)[0][1])
+        cn = self.dn_cn_cache.get(dnin)
+        if cn is None:
+            cn = self.unescapecn(dn.parse_dn(dnin)[0][1])
+            self.dn_cn_cache[dnin] = cn
         return cn
 
     #Unescape special DN characters from a CN (only needed if it comes from a DN)
     def unescapecn(self, cn):
-        for c in ' "#+,;<=>\\\00':
-            cn = cn.replace('\\'+c, c)
-        return cn
+        return _CN_UNESCAPE.sub(r'\1', cn)
 
     #Sort users by group they belong to
     def sortUsersByGroup(self, items):
-        groupsdict = {}
         #Make sure the group CN mapping already exists
         if self.groups_dnmap is None:
             self.mapGroupsIdsToDns()
+        dnmap = self.groups_dnmap
+        getcn = self.getGroupCnFromDn
+        #First sort the users by group DN, so the CN only has to be looked up once per group instead of once per member
+        dngroupsdict = defaultdict(list)
         for user in items:
-            try:
-                ugroups = [self.getGroupCnFromDn(group) for group in user.memberOf.values]
+            memberof = get_entry_attribute(user, 'memberOf')
             #If the user is only in the default group, its memberOf property wont exist
-            except (LDAPAttributeError, LDAPCursorError):
-                ugroups = []
+            if memberof is not None:
+                for group in memberof.values:
+                    dngroupsdict[group].append(user)
             #Add the user default group
-            try:
-                ugroups.append(self.getGroupCnFromDn(self.groups_dnmap[user.primaryGroupId.value]))
+            primarygroup = get_entry_attribute(user, 'primaryGroupId')
             # Sometimes we can't query this group or it doesn't exist
-            except KeyError:
-                pass
-            for group in ugroups:
-                try:
-                    groupsdict[group].append(user)
-                except KeyError:
-                    #Group is not yet in dict
-                    groupsdict[group] = [user]
+            if primarygroup is not None and primarygroup.value in dnmap:
+                dngroupsdict[dnmap[primarygroup.value]].append(user)
+
+        groupsdict = defaultdict(list)
+        mergedgroups = set()
+        for groupdn, users in dngroupsdict.items():
+            cn = getcn(groupdn)
+            if cn in groupsdict:
+                #Different groups with the same CN, their users have to be put back in the original order
+                mergedgroups.add(cn)
+            groupsdict[cn].extend(users)
+        if mergedgroups:
+            positions = {id(user): position for position, user in enumerate(items)}
+            for cn in mergedgroups:
+                groupsdict[cn].sort(key=lambda user: positions[id(user)])
 
         #Append any groups that are members of groups
         for group in self.groups:
-            try:
-                for parentgroup in group.memberOf.values:
-                    try:
-                        groupsdict[self.getGroupCnFromDn(parentgroup)].append(group)
-                    except KeyError:
-                        #Group is not yet in dict
-                        groupsdict[self.getGroupCnFromDn(parentgroup)] = [group]
+            memberof = get_entry_attribute(group, 'memberOf')
             #Without subgroups this attribute does not exist
-            except (LDAPAttributeError, LDAPCursorError):
-                pass
+            if memberof is None:
+                continue
+            for parentgroup in memberof.values:
+                groupsdict[getcn(parentgroup)].append(group)
 
-        return groupsdict
+        return dict(groupsdict)
 
     #Main function
     def domainDump(self):
-        self.users = self.getAllUsers()
-        self.computers = self.getAllComputers()
-        self.groups = self.getAllGroups()
+        if self.config.poolsize > 1:
+            #Determine the page size before the parallel searches need it
+            self.getPageSize()
+            #With multiple connections, the large paged searches can run concurrently, each on its own connection
+            self.users, self.computers, self.groups = self.runParallel([(self.getAllUsers, ()), (self.getAllComputers, ()), (self.getAllGroups, ())], min(3, self.config.poolsize))
+        else:
+            self.users = self.getAllUsers()
+            self.computers = self.getAllComputers()
+            self.groups = self.getAllGroups()
         if self.config.lookuphostnames:
             self.lookupComputerDnsNames()
         self.policy = self.getDomainPolicy()
@@ -427,6 +652,8 @@ class reportWriter():
     def __init__(self, config):
         self.config = config
         self.dd = None
+        self.dn_cn_cache = {} #Cache of group CNs by DN
+        self.flags_cache = {} #Cache of parsed flags by flag definition and value
         if self.config.lookuphostnames:
             self.computerattributes = ['cn', 'sAMAccountName', 'dNSHostName', 'IPv4', 'operatingSystem', 'operatingSystemServicePack', 'operatingSystemVersion', 'lastLogon', 'userAccountControl', 'whenCreated', 'objectSid', 'description']
         else:
@@ -437,6 +664,26 @@ class reportWriter():
         self.groupattributes = ['cn', 'sAMAccountName', 'memberOf', 'description', 'whenCreated', 'whenChanged', 'objectSid']
         self.policyattributes = ['distinguishedName', 'lockOutObservationWindow', 'lockoutDuration', 'lockoutThreshold', 'maxPwdAge', 'minPwdAge', 'minPwdLength', 'pwdHistoryLength', 'pwdProperties', 'ms-DS-MachineAccountQuota']
         self.trustattributes = ['cn', 'flatName', 'securityIdentifier', 'trustAttributes', 'trustDirection', 'trustType']
+        #The HTML column headers only depend on the attributes, so they are generated once
+        self.computerthead = self.generateHtmlThead(self.computerattributes)
+        self.userthead = self.generateHtmlThead(self.userattributes)
+        self.userthead_grouped = self.generateHtmlThead(self.userattributes_grouped)
+        self.groupthead = self.generateHtmlThead(self.groupattributes)
+        self.policythead = self.generateHtmlThead(self.policyattributes)
+        self.trustthead = self.generateHtmlThead(self.trustattributes)
+        #The style is the same for every HTML file, so it is read only once
+        self.styleblock = self.readStyle()
+        #Create the output directory once, instead of checking it for every file
+        os.makedirs(self.config.basepath, exist_ok=True)
+
+    #Read the style from the package directory and return it as a style block
+    def readStyle(self):
+        try:
+            with open(os.path.join(os.path.dirname(__file__), 'style.css'), 'r') as sf:
+                return '<style type="text/css">' + sf.read() + '</style>'
+        except IOError:
+            log_warn('style.css not found in package directory, styling will be skipped')
+            return ''
 
     #Escape HTML special chars
     def htmlescape(self, html):
@@ -444,9 +691,7 @@ class reportWriter():
 
     #Unescape special DN characters from a CN (only needed if it comes from a DN)
     def unescapecn(self, cn):
-        for c in ' "#+,;<=>\\\00':
-            cn = cn.replace('\\'+c, c)
-        return cn
+        return _CN_UNESCAPE.sub(r'\1', cn)
 
     #Convert password max age (in 100 nanoseconds), to days
     def nsToDays(self, length):
@@ -464,14 +709,17 @@ class reportWriter():
             return abs(length) * .0000001 / 60
 
     #Parse bitwise flags into a list
+    #There are only a few distinct flag values in a domain, so the parsed flags are cached
     def parseFlags(self, attr, flags_def):
-        outflags = []
         if attr is None or attr.value is None:
-            return outflags
-        for flag, val in flags_def.items():
-            if int(attr.value) & val:
-                outflags.append(flag)
-        return outflags
+            return []
+        value = int(attr.value)
+        try:
+            outflags = self.flags_cache[(id(flags_def), value)]
+        except KeyError:
+            outflags = [flag for flag, val in flags_def.items() if value & val]
+            self.flags_cache[(id(flags_def), value)] = outflags
+        return list(outflags)
 
     #Parse bitwise trust direction - only one flag applies here, 0x03 overlaps
     def parseSingleFlag(self, attr, flags_def):
@@ -483,8 +731,14 @@ class reportWriter():
                 outflags.append(flag)
         return outflags
 
-    #Generate a HTML table from a list of entries, with the specified attributes as column
-    def generateHtmlTable(self, listable, attributes, header='', firstTable=True, specialGroupsFormat=False):
+    #Generate the HTML column headers for the specified attributes
+    def generateHtmlThead(self, attributes):
+        #Print alias of this attribute if there is one
+        return ''.join(['<th>%s</th>' % self.htmlescape(attr_translations.get(hdr, hdr)) for hdr in attributes])
+
+    #Generate the start of a HTML table, with the specified attributes as column
+    #The column headers can be passed in as thead if they were generated before
+    def generateHtmlTableHeader(self, attributes, header='', firstTable=True, thead=None):
         of = []
         #Only if this is the first table it is an actual table, the others are just bodies of the first table
         #This makes sure that multiple tables have their columns aligned to make it less messy
@@ -494,85 +748,106 @@ class reportWriter():
         if header != '':
             of.append('<thead><tr><td colspan="%d" id="cn_%s">%s</td></tr></thead>' % (len(attributes), self.formatId(header), header))
         of.append('<tbody><tr>')
-        for hdr in attributes:
-            try:
-                #Print alias of this attribute if there is one
-                of.append('<th>%s</th>' % self.htmlescape(attr_translations[hdr]))
-            except KeyError:
-                of.append('<th>%s</th>' % self.htmlescape(hdr))
+        if thead is None:
+            thead = self.generateHtmlThead(attributes)
+        of.append(thead)
         of.append('</tr>\n')
-        for li in listable:
-            #Whether we should format group objects separately
-            if specialGroupsFormat and 'group' in li['objectClass'].values:
-                #Give it an extra class and pass it to the function below to make sure the CN is a link
-                liIsGroup = True
-                of.append('<tr class="group">')
+        return ''.join(of)
+
+    #Generate a HTML table row for a single entry
+    def generateHtmlRow(self, li, attributes, specialGroupsFormat=False):
+        of = []
+        #Whether we should format group objects separately
+        if specialGroupsFormat and 'group' in li['objectClass'].values:
+            #Give it an extra class and pass it to the function below to make sure the CN is a link
+            liIsGroup = True
+            of.append('<tr class="group">')
+        else:
+            liIsGroup = False
+            of.append('<tr>')
+        for att in attributes:
+            #The IPv4 address is not an LDAP attribute but is resolved by the dumper
+            if att == 'IPv4':
+                ip = self.getIPv4(li)
+                of.append('<td>%s</td>' % (self.htmlescape(ip) if ip is not None else '&nbsp;'))
+                continue
+            attr = get_entry_attribute(li, att)
+            if attr is not None:
+                of.append('<td>%s</td>' % self.formatAttribute(attr, liIsGroup))
             else:
-                liIsGroup = False
-                of.append('<tr>')
-            for att in attributes:
-                try:
-                    of.append('<td>%s</td>' % self.formatAttribute(li[att], liIsGroup))
-                except (LDAPKeyError, LDAPCursorError):
-                    of.append('<td>&nbsp;</td>')
-            of.append('</tr>\n')
-        of.append('</tbody>\n')
+                of.append('<td>&nbsp;</td>')
+        of.append('</tr>\n')
         return ''.join(of)
 
-    #Generate several HTML tables for grouped reports
-    def generateGroupedHtmlTables(self, groups, attributes):
+    #Write a HTML table of a list of entries to out, with the specified attributes as column
+    def writeHtmlTable(self, out, listable, attributes, header='', firstTable=True, specialGroupsFormat=False, thead=None):
+        out.write(self.generateHtmlTableHeader(attributes, header, firstTable, thead))
+        for li in listable:
+            out.write(self.generateHtmlRow(li, attributes, specialGroupsFormat))
+        out.write('</tbody>\n')
+
+    #Generate a HTML table from a list of entries, with the specified attributes as column
+    def generateHtmlTable(self, listable, attributes, header='', firstTable=True, specialGroupsFormat=False, thead=None):
+        out = io.StringIO()
+        self.writeHtmlTable(out, listable, attributes, header, firstTable, specialGroupsFormat, thead)
+        return out.getvalue()
+
+    #Write several HTML tables for grouped reports to out
+    def writeGroupedHtmlTables(self, out, groups, attributes, thead=None):
+        #Every table has the same columns
+        if thead is None:
+            thead = self.generateHtmlThead(attributes)
         first = True
         for groupname, members in groups.items():
-            yield self.generateHtmlTable(members, attributes, groupname, first, specialGroupsFormat=True)
+            self.writeHtmlTable(out, members, attributes, groupname, first, specialGroupsFormat=True, thead=thead)
             if first:
                 first = False
 
+    #Open an output file in the output directory
+    #The large buffer makes sure big reports are written in few large writes
+    def openOutputFile(self, rel_outfile):
+        outfile = os.path.join(self.config.basepath, rel_outfile)
+        return io.open(outfile, 'w', encoding='utf8', newline='', buffering=1048576)
+
+    #Write the start of a HTML document, up to the body
+    def writeHtmlHeader(self, of):
+        of.write('<!DOCTYPE html>\n<html>\n<head><meta charset="UTF-8">')
+        #Include the style
+        of.write(self.styleblock)
+        of.write('</head><body>')
+
+    #Write the end of a HTML document
+    def writeHtmlFooter(self, of, closeTable=True):
+        #Does the body contain an open table?
+        if closeTable:
+            of.write('</table>')
+        of.write('</body></html>')
+
     #Write generated HTML to file
+    #Instead of a HTML blob, a function can be passed in genfunc which writes the body to the file itself
     def writeHtmlFile(self, rel_outfile, body, genfunc=None, genargs=None, closeTable=True):
-        if not os.path.exists(self.config.basepath):
-            os.makedirs(self.config.basepath)
-        outfile = os.path.join(self.config.basepath, rel_outfile)
-        with codecs.open(outfile, 'w', 'utf8') as of:
-            of.write('<!DOCTYPE html>\n<html>\n<head><meta charset="UTF-8">')
-            #Include the style
-            try:
-                with open(os.path.join(os.path.dirname(__file__), 'style.css'), 'r') as sf:
-                    of.write('<style type="text/css">')
-                    of.write(sf.read())
-                    of.write('</style>')
-            except IOError:
-                log_warn('style.css not found in package directory, styling will be skipped')
-            of.write('</head><body>')
+        with self.openOutputFile(rel_outfile) as of:
+            self.writeHtmlHeader(of)
             #If the generator is not specified, we should write the HTML blob directly
             if genfunc is None:
                 of.write(body)
             else:
-                for tpart in genfunc(*genargs):
-                    of.write(tpart)
-            #Does the body contain an open table?
-            if closeTable:
-                of.write('</table>')
-            of.write('</body></html>')
+                genfunc(of, *genargs)
+            self.writeHtmlFooter(of, closeTable)
 
     #Write generated JSON to file
+    #Instead of a JSON blob, a function can be passed in genfunc which writes the JSON to the file itself
     def writeJsonFile(self, rel_outfile, jsondata, genfunc=None, genargs=None):
-        if not os.path.exists(self.config.basepath):
-            os.makedirs(self.config.basepath)
-        outfile = os.path.join(self.config.basepath, rel_outfile)
-        with codecs.open(outfile, 'w', 'utf8') as of:
+        with self.openOutputFile(rel_outfile) as of:
             #If the generator is not specified, we should write the JSON blob directly
             if genfunc is None:
                 of.write(jsondata)
             else:
-                for jpart in genfunc(*genargs):
-                    of.write(jpart)
+                genfunc(of, *genargs)
 
     #Write generated Greppable stuff to file
     def writeGrepFile(self, rel_outfile, body):
-        if not os.path.exists(self.config.basepath):
-            os.makedirs(self.config.basepath)
-        outfile = os.path.join(self.config.basepath, rel_outfile)
-        with codecs.open(outfile, 'w', 'utf8') as of:
+        with self.openOutputFile(rel_outfile) as of:
             of.write(body)
 
     #Format a value for HTML
@@ -595,23 +870,14 @@ class reportWriter():
         #Other type: just return it
         return value
 
-    #Format an attribute to a human readable format
-    def formatAttribute(self, att, formatCnAsGroup=False):
-        aname = att.key.lower()
+    #Format an attribute to a human readable plain text value
+    #This is shared by the HTML and the grep output, which only differ in formatting groups and SIDs
+    def formatPlainAttribute(self, att, aname):
         #User flags
         if aname == 'useraccountcontrol':
             return ', '.join(self.parseFlags(att, uac_flags))
-        #List of groups
-        if aname == 'member' or aname == 'memberof' and type(att.values) is list:
-            return self.formatGroupsHtml(att.values)
-        #Primary group
-        if aname == 'primarygroupid':
-            try:
-                return self.formatGroupsHtml([self.dd.groups_dnmap[att.value]])
-            except KeyError:
-                return 'NOT FOUND!'
         if aname == 'description' and type(att.values) is list:
-             return " ".join(att.values)
+            return " ".join(att.values)
         #Pwd flags
         if aname == 'pwdproperties':
             return ', '.join(self.parseFlags(att, pwd_flags))
@@ -619,7 +885,7 @@ class reportWriter():
         if aname == 'trustattributes':
             return ', '.join(self.parseFlags(att, trust_flags))
         if aname == 'trustdirection':
-            if  att.value == 0:
+            if att.value == 0:
                 return 'DISABLED'
             else:
                 return ', '.join(self.parseSingleFlag(att, trust_directions))
@@ -631,13 +897,30 @@ class reportWriter():
             return '%.2f days' % self.nsToDays(att.value)
         if aname == 'lockoutobservationwindow' or  aname == 'lockoutduration':
             return '%.1f minutes' % self.nsToMinutes(att.value)
+        #Other
+        return self.formatString(att.value)
+
+    #Format an attribute to a human readable format
+    def formatAttribute(self, att, formatCnAsGroup=False):
+        aname = att.key.lower()
+        #Most attributes are plain values, which don't have to go past all the checks below
+        if aname not in _FORMATTED_ATTRIBUTES:
+            return self.htmlescape(self.formatString(att.value))
+        #List of groups
+        if aname == 'member' or aname == 'memberof' and type(att.values) is list:
+            return self.formatGroupsHtml(att.values)
+        #Primary group
+        if aname == 'primarygroupid':
+            try:
+                return self.formatGroupsHtml([self.dd.groups_dnmap[att.value]])
+            except KeyError:
+                return 'NOT FOUND!'
         if aname == 'objectsid':
             return '<abbr title="%s">%s</abbr>' % (att.value, att.value.split('-')[-1])
         #Special case where the attribute is a CN and it should be made clear its a group
         if aname == 'cn' and formatCnAsGroup:
             return self.formatCnWithGroupLink(att.value)
-        #Other
-        return self.htmlescape(self.formatString(att.value))
+        return self.htmlescape(self.formatPlainAttribute(att, aname))
 
 
     def formatCnWithGroupLink(self, cn):
@@ -645,7 +928,7 @@ class reportWriter():
 
     #Convert a CN to a valid HTML id by replacing all non-ascii characters with a _
     def formatId(self, cn):
-        return re.sub(r'[^a-zA-Z0-9_\-]+', '_', cn)
+        return _ID_RE.sub('_', cn)
 
     # Fallback function for dirty DN parsing in case ldap3 functions error out
     def parseDnFallback(self, dn):
@@ -660,15 +943,23 @@ class reportWriter():
             cn = dn
         return cn
 
-    #Format groups to readable HTML
-    def formatGroupsHtml(self, grouplist):
-        outcache = []
-        for group in grouplist:
+    #Get the CN of a group from its DN, cached since the same groups occur for many entries
+    def getGroupCnFromDn(self, group):
+        cn = self.dn_cn_cache.get(group)
+        if cn is None:
             try:
                 cn = self.unescapecn(dn.parse_dn(group)[0][1])
             except LDAPInvalidDnError:
                 # Parsing failed, do it manually
                 cn = self.unescapecn(self.parseDnFallback(group))
+            self.dn_cn_cache[group] = cn
+        return cn
+
+    #Format groups to readable HTML
+    def formatGroupsHtml(self, grouplist):
+        outcache = []
+        for group in grouplist:
+            cn = self.getGroupCnFromDn(group)
             outcache.append('<a href="%s.html#cn_%s" title="%s">%s</a>' % (self.config.users_by_group, quote_plus(self.formatId(cn)), self.htmlescape(group), self.htmlescape(cn)))
         return ', '.join(outcache)
 
@@ -676,20 +967,14 @@ class reportWriter():
     def formatGroupsGrep(self, grouplist):
         outcache = []
         for group in grouplist:
-            try:
-                cn = self.unescapecn(dn.parse_dn(group)[0][1])
-            except LDAPInvalidDnError:
-                # Parsing failed, do it manually
-                cn = self.unescapecn(self.parseDnFallback(group))
-            outcache.append(cn)
+            outcache.append(self.getGroupCnFromDn(group))
         return ', '.join(outcache)
 
     #Format attribute for grepping
     def formatGrepAttribute(self, att):
         aname = att.key.lower()
-        #User flags
-        if aname == 'useraccountcontrol':
-            return ', '.join(self.parseFlags(att, uac_flags))
+        if aname not in _FORMATTED_ATTRIBUTES:
+            return self.formatString(att.value)
         #List of groups
         if aname == 'member' or aname == 'memberof' and type(att.values) is list:
             return self.formatGroupsGrep(att.values)
@@ -698,152 +983,170 @@ class reportWriter():
                 return self.formatGroupsGrep([self.dd.groups_dnmap[att.value]])
             except KeyError:
                 return 'NOT FOUND!'
-        if aname == 'description' and type(att.values) is list:
-            return " ".join(att.values)
-        #Domain trust flags
-        if aname == 'trustattributes':
-            return ', '.join(self.parseFlags(att, trust_flags))
-        if aname == 'trustdirection':
-            if att.value == 0:
-                return 'DISABLED'
+        return self.formatPlainAttribute(att, aname)
+
+    #Generate a single grep/awk/cut-able line for an entry
+    def generateGrepLine(self, entry, attributes):
+        eo = []
+        for attr in attributes:
+            #The IPv4 address is not an LDAP attribute but is resolved by the dumper
+            if attr == 'IPv4':
+                eo.append(self.getIPv4(entry) or '')
+                continue
+            att = get_entry_attribute(entry, attr)
+            if att is not None:
+                eo.append(self.formatGrepAttribute(att) or '')
             else:
-                return ', '.join(self.parseSingleFlag(att, trust_directions))
-        if aname == 'trusttype':
-            return ', '.join(self.parseSingleFlag(att, trust_type))
-        if aname == 'securityidentifier':
-            return format_sid(att.raw_values[0])
-        #Pwd flags
-        if aname == 'pwdproperties':
-            return ', '.join(self.parseFlags(att, pwd_flags))
-        if aname == 'minpwdage' or  aname == 'maxpwdage':
-            return '%.2f days' % self.nsToDays(att.value)
-        if aname == 'lockoutobservationwindow' or  aname == 'lockoutduration':
-            return '%.1f minutes' % self.nsToMinutes(att.value)
-        return self.formatString(att.value)
+                eo.append('')
+        return self.config.grepsplitchar.join(eo)
 
     #Generate grep/awk/cut-able output
     def generateGrepList(self, entrylist, attributes):
         hdr = self.config.grepsplitchar.join(attributes)
         out = [hdr]
         for entry in entrylist:
-            eo = []
-            for attr in attributes:
-                try:
-                    eo.append(self.formatGrepAttribute(entry[attr]) or '')
-                except (LDAPKeyError, LDAPCursorError):
-                    eo.append('')
-            out.append(self.config.grepsplitchar.join(eo))
+            out.append(self.generateGrepLine(entry, attributes))
         return '\n'.join(out)
 
-    #Convert a list of entities to a JSON string
-    #String concatenation is used here since the entities have their own json generate
+    #Get the resolved IPv4 address of a computer entry, if it was looked up
+    def getIPv4(self, entry):
+        if self.dd is None:
+            return None
+        return self.dd.ipv4.get(entry.entry_dn)
+
+    #Convert an entry to JSON, including the IPv4 address of computers if it was resolved
+    #This gives the same output as entry.entry_to_json(), but without the deep copy
+    #of all attribute values which ldap3 makes for this
+    def entryToJson(self, entry):
+        attributes = {key: att.values for key, att in entry._state.attributes.items()}
+        ip = self.getIPv4(entry)
+        if ip is not None:
+            attributes['IPv4'] = [ip]
+        return json.dumps({'dn': entry.entry_dn, 'attributes': attributes},
+                          ensure_ascii=True,
+                          sort_keys=True,
+                          indent=4,
+                          default=format_json,
+                          separators=(',', ': '))
+
+    #Write a list of entities as JSON to out
+    #The JSON of the entities is written directly since the entities have their own json generate
     #method and converting the string back to json just to process it would be inefficient
+    def writeJsonList(self, out, entrylist):
+        out.write('[')
+        first = True
+        for entry in entrylist:
+            if not first:
+                out.write(',')
+            else:
+                first = False
+            out.write(self.entryToJson(entry))
+        out.write(']')
+
+    #Convert a list of entities to a JSON string
     def generateJsonList(self, entrylist):
-        out = '[' + ','.join([entry.entry_to_json() for entry in entrylist]) + ']'
-        return out
+        out = io.StringIO()
+        self.writeJsonList(out, entrylist)
+        return out.getvalue()
 
-    #Convert a group key/value pair to json
+    #Write a group key/value pair as json to out
     #Same methods as previous function are used
-    def generateJsonGroup(self, group):
-        out = '{%s:%s}' % (json.dumps(group[0]), self.generateJsonList(group[1]))
-        return out
-
-    #Convert a list of group dicts with entry lists to JSON string
-    #Same methods as previous functions are used, except that text is returned
-    #from a generator rather than allocating everything in memory
-    def generateJsonGroupedList(self, groups):
+    def writeJsonGroup(self, out, group):
+        out.write('{%s:' % json.dumps(group[0]))
+        self.writeJsonList(out, group[1])
+        out.write('}')
+
+    #Write a list of group dicts with entry lists as JSON to out
+    #Same methods as previous functions are used, the groups are written one by
+    #one rather than allocating everything in memory
+    def writeJsonGroupedList(self, out, groups):
         #Start of the list
-        yield '['
+        out.write('[')
         firstGroup = True
         for group in groups.items():
             if not firstGroup:
                 #Separate items
-                yield ','
+                out.write(',')
             else:
                 firstGroup = False
-            yield self.generateJsonGroup(group)
-        yield ']'
+            self.writeJsonGroup(out, group)
+        out.write(']')
 
     #Generate report of all computers grouped by OS family
     def generateComputersByOsReport(self, dd):
+        self.dd = dd
         grouped = dd.sortComputersByOS(dd.computers)
         if self.config.outputhtml:
-            #Use the generator approach to save memory
-            self.writeHtmlFile('%s.html' % self.config.computers_by_os, None, genfunc=self.generateGroupedHtmlTables, genargs=(grouped, self.computerattributes))
+            #Write the tables directly to the file to save memory
+            self.writeHtmlFile('%s.html' % self.config.computers_by_os, None, genfunc=self.writeGroupedHtmlTables, genargs=(grouped, self.computerattributes, self.computerthead))
         if self.config.outputjson and self.config.groupedjson:
-            self.writeJsonFile('%s.json' % self.config.computers_by_os, None, genfunc=self.generateJsonGroupedList, genargs=(grouped, ))
+            self.writeJsonFile('%s.json' % self.config.computers_by_os, None, genfunc=self.writeJsonGroupedList, genargs=(grouped, ))
 
     #Generate report of all groups and detailled user info
     def generateUsersByGroupReport(self, dd):
         grouped = dd.sortUsersByGroup(dd.users)
         if self.config.outputhtml:
-            #Use the generator approach to save memory
-            self.writeHtmlFile('%s.html' % self.config.users_by_group, None, genfunc=self.generateGroupedHtmlTables, genargs=(grouped, self.userattributes_grouped))
+            #Write the tables directly to the file to save memory
+            self.writeHtmlFile('%s.html' % self.config.users_by_group, None, genfunc=self.writeGroupedHtmlTables, genargs=(grouped, self.userattributes_grouped, self.userthead_grouped))
         if self.config.outputjson and self.config.groupedjson:
-            self.writeJsonFile('%s.json' % self.config.users_by_group, None, genfunc=self.generateJsonGroupedList, genargs=(grouped, ))
+            self.writeJsonFile('%s.json' % self.config.users_by_group, None, genfunc=self.writeJsonGroupedList, genargs=(grouped, ))
+
+    #Write the HTML, grep and JSON reports of a list of entries
+    #All enabled formats are written in a single pass over the entries
+    def generateReport(self, entries, attributes, basename, header, thead=None):
+        with ExitStack() as stack:
+            htmlfile = grepfile = jsonfile = None
+            if self.config.outputhtml:
+                htmlfile = stack.enter_context(self.openOutputFile('%s.html' % basename))
+                self.writeHtmlHeader(htmlfile)
+                htmlfile.write(self.generateHtmlTableHeader(attributes, header, thead=thead))
+            if self.config.outputgrep:
+                grepfile = stack.enter_context(self.openOutputFile('%s.grep' % basename))
+                grepfile.write(self.config.grepsplitchar.join(attributes))
+            if self.config.outputjson:
+                jsonfile = stack.enter_context(self.openOutputFile('%s.json' % basename))
+                jsonfile.write('[')
+            first = True
+            for entry in entries:
+                if htmlfile:
+                    htmlfile.write(self.generateHtmlRow(entry, attributes))
+                if grepfile:
+                    grepfile.write('\n')
+                    grepfile.write(self.generateGrepLine(entry, attributes))
+                if jsonfile:
+                    if not first:
+                        jsonfile.write(',')
+                    jsonfile.write(self.entryToJson(entry))
+                first = False
+            if htmlfile:
+                htmlfile.write('</tbody>\n')
+                self.writeHtmlFooter(htmlfile)
+            if jsonfile:
+                jsonfile.write(']')
 
     #Generate report with just a table of all users
     def generateUsersReport(self, dd):
         #Copy dd to this object, to be able to reference it
         self.dd = dd
         dd.mapGroupsIdsToDns()
-        if self.config.outputhtml:
-            html = self.generateHtmlTable(dd.users, self.userattributes, 'Domain users')
-            self.writeHtmlFile('%s.html' % self.config.usersfile, html)
-        if self.config.outputgrep:
-            grepout = self.generateGrepList(dd.users, self.userattributes)
-            self.writeGrepFile('%s.grep' % self.config.usersfile, grepout)
-        if self.config.outputjson:
-            jsonout = self.generateJsonList(dd.users)
-            self.writeJsonFile('%s.json' % self.config.usersfile, jsonout)
+        self.generateReport(dd.users, self.userattributes, self.config.usersfile, 'Domain users', self.userthead)
 
     #Generate report with just a table of all computer accounts
     def generateComputersReport(self, dd):
-        if self.config.outputhtml:
-            html = self.generateHtmlTable(dd.computers, self.computerattributes, 'Domain computer accounts')
-            self.writeHtmlFile('%s.html' % self.config.computersfile, html)
-        if self.config.outputgrep:
-            grepout = self.generateGrepList(dd.computers, self.computerattributes)
-            self.writeGrepFile('%s.grep' % self.config.computersfile, grepout)
-        if self.config.outputjson:
-            jsonout = self.generateJsonList(dd.computers)
-            self.writeJsonFile('%s.json' % self.config.computersfile, jsonout)
+        self.dd = dd
+        self.generateReport(dd.computers, self.computerattributes, self.config.computersfile, 'Domain computer accounts', self.computerthead)
 
     #Generate report with just a table of all computer accounts
     def generateGroupsReport(self, dd):
-        if self.config.outputhtml:
-            html = self.generateHtmlTable(dd.groups, self.groupattributes, 'Domain groups')
-            self.writeHtmlFile('%s.html' % self.config.groupsfile, html)
-        if self.config.outputgrep:
-            grepout = self.generateGrepList(dd.groups, self.groupattributes)
-            self.writeGrepFile('%s.grep' % self.config.groupsfile, grepout)
-        if self.config.outputjson:
-            jsonout = self.generateJsonList(dd.groups)
-            self.writeJsonFile('%s.json' % self.config.groupsfile, jsonout)
+        self.generateReport(dd.groups, self.groupattributes, self.config.groupsfile, 'Domain groups', self.groupthead)
 
     #Generate policy report
     def generatePolicyReport(self, dd):
-        if self.config.outputhtml:
-            html = self.generateHtmlTable(dd.policy, self.policyattributes, 'Domain policy')
-            self.writeHtmlFile('%s.html' % self.config.policyfile, html)
-        if self.config.outputgrep:
-            grepout = self.generateGrepList(dd.policy, self.policyattributes)
-            self.writeGrepFile('%s.grep' % self.config.policyfile, grepout)
-        if self.config.outputjson:
-            jsonout = self.generateJsonList(dd.policy)
-            self.writeJsonFile('%s.json' % self.config.policyfile, jsonout)
+        self.generateReport(dd.policy, self.policyattributes, self.config.policyfile, 'Domain policy', self.policythead)
 
     #Generate policy report
     def generateTrustsReport(self, dd):
-        if self.config.outputhtml:
-            html = self.generateHtmlTable(dd.trusts, self.trustattributes, 'Domain trusts')
-            self.writeHtmlFile('%s.html' % self.config.trustsfile, html)
-        if self.config.outputgrep:
-            grepout = self.generateGrepList(dd.trusts, self.trustattributes)
-            self.writeGrepFile('%s.grep' % self.config.trustsfile, grepout)
-        if self.config.outputjson:
-            jsonout = self.generateJsonList(dd.trusts)
-            self.writeJsonFile('%s.json' % self.config.trustsfile, jsonout)
+        self.generateReport(dd.trusts, self.trustattributes, self.config.trustsfile, 'Domain trusts', self.trustthead)
 
 #Some quick logging helpers
 def log_warn(text):
@@ -879,6 +1182,7 @@ def main():
     miscgroup.add_argument("-r", "--resolve", action='store_true', help="Resolve computer hostnames (might take a while and cause high traffic on large networks)")
     miscgroup.add_argument("-n", "--dns-server", help="Use custom DNS resolver instead of system DNS (try a domain controller IP)")
     miscgroup.add_argument("-m", "--minimal", action='store_true', default=False, help="Only query minimal set of attributes to limit memmory usage")
+    miscgroup.add_argument("--pool-size", type=int, default=4, metavar='SIZE', help="Number of parallel LDAP connections to use (default: 4, 1 uses a single connection)")
 
     args = parser.parse_args()
     #Create default config
@@ -909,6 +1213,7 @@ def main():
         cnf.basepath = args.outdir
     #Do we really need grouped json files?
     cnf.groupedjson = args.grouped_json
+    cnf.poolsize = args.pool_size
 
     #Prompt for password if not set
     authentication = None
@@ -928,7 +1233,7 @@ def main():
     s = Server(args.host, get_info=ALL)
     log_info('Connecting to host...')
 
-    c = Connection(s, user=args.user, password=args.password, authentication=authentication)
+    c = Connection(s, user=args.user, password=args.password, authentication=authentication, auto_range=False)
     log_info('Binding to host')
     # perform the Bind operation
     if not c.bind():